@@ -1,16 +1,82 @@
 import argparse
 import os
-from osgeo import gdal, ogr
+from osgeo import gdal, ogr, osr
+
+
+# Литеры рядов листов 1 : 1 000 000 (по 4 градуса широты от экватора до 88°).
+# Полярная шапка Z (88°-90°) не делится на колонны по 6°, поэтому не поддерживается
+SHEET_ROWS = 'ABCDEFGHIJKLMNOPQRSTUV'
+# Литеры четвертей листа: 1 : 50 000 (внутри 1 : 100 000) - заглавные, 1 : 25 000 (внутри 1 : 50 000) - строчные
+SHEET_QUARTERS = ({'А': 0, 'A': 0, 'Б': 1, 'В': 2, 'Г': 3},
+                  {'а': 0, 'a': 0, 'б': 1, 'в': 2, 'г': 3})
+
+
+def sheet_bounds(sheet):
+    """
+    Geographic boundary of nomenclature sheet (N-37, N-37-144, N-37-144-А, N-37-144-А-а).
+    :param sheet: Sheet name: str.
+    :return: (lon_min, lat_min, lon_max, lat_max): tuple.
+    """
+    parts = sheet.strip().split('-')
+
+    try:
+        row = SHEET_ROWS.index(parts[0].upper())
+        column = int(parts[1])
+        if not 1 <= column <= 60:
+            raise ValueError
+        left, top = (column - 1) * 6 - 180, row * 4 + 4
+        step_x, step_y = 6, 4
+
+        if len(parts) > 2:
+            n = int(parts[2])
+            if not 1 <= n <= 144:
+                raise ValueError
+            step_x, step_y = 30 / 60, 20 / 60
+            left = left + (n - 1) % 12 * step_x
+            top = top - (n - 1) // 12 * step_y
+
+        for quarters, litera in zip(SHEET_QUARTERS, parts[3:5]):
+            quarter = quarters[litera]
+            step_x, step_y = step_x / 2, step_y / 2
+            left = left + quarter % 2 * step_x
+            top = top - quarter // 2 * step_y
+
+        if len(parts) > 5:
+            raise ValueError
+    except (ValueError, IndexError, KeyError):
+        raise ValueError('Error. Unknown nomenclature sheet: {}'.format(sheet))
+
+    return left, top - step_y, left + step_x, top
 
 
 class SxfExporter:
     def __init__(self,
                  sxf: str,
                  shp_dir: str,
-                 driver=ogr.GetDriverByName("ESRI Shapefile")):
+                 driver=ogr.GetDriverByName("ESRI Shapefile"),
+                 layers=None,
+                 where=None,
+                 bbox=None,
+                 sheet=None):
+        """
+        :param sxf: Path to SXF: str.
+        :param shp_dir: Directory for exported shapefiles: str.
+        :param driver: Driver for vector layer: osgeo.ogr object.
+        :param layers: Names or numbers (as listed in metadata, from 1) of SXF layers to export: list.
+        :param where: Attribute filter in OGR SQL, e.g. "CLCODE = 31120000": str.
+        :param bbox: Spatial filter in SXF coordinates (xmin, ymin, xmax, ymax): tuple.
+        :param sheet: Spatial filter by nomenclature sheet name, e.g. "N-37-144": str.
+        """
+        if bbox is not None and sheet is not None:
+            raise ValueError('Error. Use either bbox or sheet as spatial filter')
+
         self.sxf = sxf
         self.shp_dir = shp_dir
         self.driver = driver
+        self.layers = [str(layer) for layer in layers] if layers else None
+        self.where = where
+        self.bbox = bbox
+        self.sheet = sheet
 
     def create_empty_shp(self, shp_path, geom_type, prj):
 
@@ -71,30 +137,99 @@ class SxfExporter:
 
         return prj
 
-    def shp_creator(self, sxfsource, prj):
+    def spatial_filter(self, prj):
+        """
+        Polygon for spatial filter in SXF coordinates by bbox or nomenclature sheet.
+        :param prj: CRS of SXF layers: osr.SpatialReference.
+        :return: ogr.Geometry or None.
+        """
+        if self.bbox is not None:
+            xmin, ymin, xmax, ymax = self.bbox
+        elif self.sheet is not None:
+            xmin, ymin, xmax, ymax = sheet_bounds(self.sheet)
+        else:
+            return None
+
+        ring = ogr.Geometry(ogr.wkbLinearRing)
+        for x, y in ((xmin, ymax), (xmax, ymax), (xmax, ymin), (xmin, ymin), (xmin, ymax)):
+            ring.AddPoint_2D(x, y)
+        poly = ogr.Geometry(ogr.wkbPolygon)
+        poly.AddGeometry(ring)
+
+        if self.sheet is not None:
+            if prj is None:
+                raise ValueError('Error. Filter by sheet requires georeferenced SXF')
+
+            # Границы листа заданы в географических координатах - переводим в СК SXF
+            source_crs = osr.SpatialReference()
+            source_crs.ImportFromProj4("+proj=longlat +datum=WGS84 +no_defs")
+            if hasattr(osr, 'OAMS_TRADITIONAL_GIS_ORDER'):
+                source_crs.SetAxisMappingStrategy(osr.OAMS_TRADITIONAL_GIS_ORDER)
+            # Плотнее описываем границы, чтобы они оставались точными после перепроецирования
+            poly.Segmentize(min(xmax - xmin, ymax - ymin) / 8)
+            poly.Transform(osr.CoordinateTransformation(source_crs, prj))
+
+        return poly
+
+    def select_layers(self, sxfsource, prj=None):
+        """
+        SXF layers chosen by name or number with attribute and spatial filters set.
+        :param sxfsource: SXF datasource: ogr.DataSource.
+        :param prj: CRS of SXF layers: osr.SpatialReference.
+        :return: list of ogr.Layer.
+        """
+        if prj is None:
+            prj = sxfsource.GetLayer(0).GetSpatialRef()
+        geom_filter = self.spatial_filter(prj)
+
+        selected = []
+        matched = set()
+        rejected = []
         for i in range(sxfsource.GetLayerCount()):
-
-            # Получаем слой и его название
-            geom_list = []
             layer = sxfsource.GetLayer(i)
             layer_name = layer.GetName()
 
-            error_count = 0
-            features_count = layer.GetFeatureCount()
+            if self.layers:
+                keys = {layer_name, str(i + 1)} & set(self.layers)
+                if not keys:
+                    continue
+                matched.update(keys)
+
+            # Семантики (SC_*) у слоев разные - слои без полей фильтра пропускаем
+            if layer.SetAttributeFilter(self.where) != 0:
+                rejected.append(layer_name)
+                continue
+            layer.SetSpatialFilter(geom_filter)
+            selected.append(layer)
 
-            # Проверяем, какие типы геометрии есть в слое
-            for _ in range(features_count):
+        if self.layers:
+            not_found = [name for name in self.layers if name not in matched]
+            if not_found:
+                raise ValueError('Error. Layers not found: {}'.format(', '.join(not_found)))
 
-                feature = layer.GetNextFeature()
+        if rejected:
+            if not selected:
+                raise ValueError('Error. Bad attribute filter for all layers: {}'.format(self.where))
+            print('\n', 'Attribute filter is not applicable, skipped layers:', ', '.join(rejected))
 
-                if not feature:
-                    error_count = error_count + 1
-                else:
-                    geometry = feature.GetGeometryRef()
-                    geom_name = geometry.GetGeometryName()
+        return selected
 
-                    if geom_name not in geom_list:
-                        geom_list.append(geom_name)
+    def shp_creator(self, layers, prj):
+        for layer in layers:
+
+            # Получаем слой и его название
+            geom_list = []
+            layer_name = layer.GetName()
+
+            # Проверяем, какие типы геометрии есть в слое.
+            # Читаем слой напрямую: с фильтрами GetFeatureCount() - это еще один полный проход
+            layer.ResetReading()
+            for feature in layer:
+                geometry = feature.GetGeometryRef()
+                geom_name = geometry.GetGeometryName()
+
+                if geom_name not in geom_list:
+                    geom_list.append(geom_name)
 
             multipointfile = False
             # Создаем соответствующие shp-файлы
@@ -124,41 +259,32 @@ class SxfExporter:
                 self.create_empty_shp(os.path.join(self.shp_dir, point_shp_name), 'POINT', prj)
                 self.write_fields_to_shp(os.path.join(self.shp_dir, point_shp_name), layer)
 
-    def write_features_to_shp(self, sxfsource):
-        for i in range(sxfsource.GetLayerCount()):
+    def write_features_to_shp(self, layers):
+        for layerw in layers:
 
-            layerw = sxfsource.GetLayer(i)
             layerw.ResetReading()
             layerw_name = layerw.GetName()
             print('\n', 'writing to %s ...' % layerw_name)
-            featuresw_count = layerw.GetFeatureCount()
-
-            for _ in range(featuresw_count):
-
-                featurew = layerw.GetNextFeature()
 
-                if featurew is None:
-                    print('\n', "Error. Feature of sxf layer is None")
-                    return
-                else:
-                    geometryw = featurew.GetGeometryRef()
-                    geom_name_feature = geometryw.GetGeometryName()
+            poly_shp_name = '{layer_name}_polygon.shp'.format(layer_name=layerw_name)
+            line_shp_name = '{layer_name}_line.shp'.format(layer_name=layerw_name)
+            point_shp_name = '{layer_name}_point.shp'.format(layer_name=layerw_name)
 
-                    poly_shp_name = '{layer_name}_polygon.shp'.format(layer_name=layerw_name)
-                    line_shp_name = '{layer_name}_line.shp'.format(layer_name=layerw_name)
-                    point_shp_name = '{layer_name}_point.shp'.format(layer_name=layerw_name)
+            for featurew in layerw:
+                geometryw = featurew.GetGeometryRef()
+                geom_name_feature = geometryw.GetGeometryName()
 
-                    if geom_name_feature == 'POLYGON':
-                        self.write_to_shp(featurew, os.path.join(self.shp_dir, poly_shp_name))
+                if geom_name_feature == 'POLYGON':
+                    self.write_to_shp(featurew, os.path.join(self.shp_dir, poly_shp_name))
 
-                    if geom_name_feature == 'MULTILINESTRING':
-                        self.write_to_shp(featurew, os.path.join(self.shp_dir, line_shp_name))
+                if geom_name_feature == 'MULTILINESTRING':
+                    self.write_to_shp(featurew, os.path.join(self.shp_dir, line_shp_name))
 
-                    if geom_name_feature == 'MULTIPOINT':
-                        self.write_to_shp(featurew, os.path.join(self.shp_dir, point_shp_name))
+                if geom_name_feature == 'MULTIPOINT':
+                    self.write_to_shp(featurew, os.path.join(self.shp_dir, point_shp_name))
 
-                    if geom_name_feature == 'POINT':
-                        self.write_to_shp(featurew, os.path.join(self.shp_dir, point_shp_name))
+                if geom_name_feature == 'POINT':
+                    self.write_to_shp(featurew, os.path.join(self.shp_dir, point_shp_name))
 
             print('writing to %s finished' % layerw_name)
 
@@ -173,8 +299,9 @@ class SxfExporter:
             raise ValueError("\nError. Path for shp files doesn't exist")
 
         prj = self.get_metadata(sxfsource)
-        self.shp_creator(sxfsource, prj)
-        self.write_features_to_shp(sxfsource)
+        layers = self.select_layers(sxfsource, prj)
+        self.shp_creator(layers, prj)
+        self.write_features_to_shp(layers)
 
         del sxfsource
 
@@ -188,15 +315,27 @@ def main():
         parser.add_argument('-out',
                             required=True, nargs='+',
                             help='Directory for exported shapefiles')
+        parser.add_argument('-layers',
+                            nargs='+',
+                            help='Names or numbers of SXF layers to export (all layers by default)')
+        parser.add_argument('-where',
+                            help='Attribute filter in OGR SQL, e.g. "CLCODE = 31120000"')
+        spatial = parser.add_mutually_exclusive_group()
+        spatial.add_argument('-bbox',
+                             nargs=4, type=float, metavar=('XMIN', 'YMIN', 'XMAX', 'YMAX'),
+                             help='Spatial filter in SXF coordinates')
+        spatial.add_argument('-sheet',
+                             help='Spatial filter by nomenclature sheet name, e.g. N-37-144')
         try:
             p = parser.parse_args()
         except Exception:
             return
 
-        return [p.sxf, p.out]
+        return [p.sxf, p.out, p.layers, p.where, p.bbox, p.sheet]
 
-    sxf, out_shp = arguments()
-    project = SxfExporter(sxf=sxf[0], shp_dir=out_shp[0])
+    sxf, out_shp, layers, where, bbox, sheet = arguments()
+    project = SxfExporter(sxf=sxf[0], shp_dir=out_shp[0],
+                          layers=layers, where=where, bbox=bbox, sheet=sheet)
     project.convert()
 
 
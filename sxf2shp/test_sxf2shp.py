@@ -0,0 +1,62 @@
+import pytest
+
+pytest.importorskip('osgeo')
+
+from sxf2shp import SxfExporter, sheet_bounds
+
+
+@pytest.mark.parametrize('sheet, bounds', [
+    ('N-37', (36, 52, 42, 56)),
+    ('N-37-144', (41.5, 52, 42, 52 + 20 / 60)),
+    ('N-37-1-А', (36, 56 - 10 / 60, 36 + 15 / 60, 56)),
+    ('N-37-144-А-а', (41.5, 52 + 15 / 60, 41.5 + 7.5 / 60, 52 + 20 / 60)),
+    ('N-37-144-Г-г', (42 - 7.5 / 60, 52, 42, 52 + 5 / 60)),
+])
+def test_sheet_bounds(sheet, bounds):
+    assert sheet_bounds(sheet) == pytest.approx(bounds)
+
+
+@pytest.mark.parametrize('sheet', ['Z-1', 'N', 'N-61', 'N-37-145', 'N-37-144-Д', 'N-37-144-А-а-1', 'N-37-144-а-А', 'X-37'])
+def test_sheet_bounds_invalid(sheet):
+    with pytest.raises(ValueError):
+        sheet_bounds(sheet)
+
+
+class FakeLayer:
+    def __init__(self, name):
+        self.name = name
+
+    def GetName(self):
+        return self.name
+
+    def GetSpatialRef(self):
+        return None
+
+    def SetAttributeFilter(self, where):
+        return 0
+
+    def SetSpatialFilter(self, geometry):
+        pass
+
+
+class FakeSource:
+    def __init__(self, *names):
+        self.layers = [FakeLayer(name) for name in names]
+
+    def GetLayerCount(self):
+        return len(self.layers)
+
+    def GetLayer(self, i):
+        return self.layers[i]
+
+
+def test_select_layers_by_number_and_name(tmp_path):
+    source = FakeSource('Hydro', 'Typo', 'Relief')
+    exporter = SxfExporter(sxf='', shp_dir=str(tmp_path), layers=[3, 'Hydro'])
+    assert [layer.GetName() for layer in exporter.select_layers(source)] == ['Hydro', 'Relief']
+
+
+def test_select_layers_not_found(tmp_path):
+    exporter = SxfExporter(sxf='', shp_dir=str(tmp_path), layers=['Hydro', 5])
+    with pytest.raises(ValueError, match='5'):
+        exporter.select_layers(FakeSource('Hydro', 'Typo'))
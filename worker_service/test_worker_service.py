@@ -0,0 +1,131 @@
+import json
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
+
+import pytest
+
+import worker_service
+from worker_service import WorkerService, job_result_path, parse_job, run_job
+
+
+def fail_task(job):
+    raise RuntimeError('boom')
+
+
+@pytest.fixture
+def tasks(monkeypatch):
+    monkeypatch.setitem(worker_service.TASKS, 'ok', lambda job: None)
+    monkeypatch.setitem(worker_service.TASKS, 'fail', fail_task)
+
+
+@pytest.fixture
+def service():
+    service = WorkerService(processes=1)
+    yield service
+    service.close()
+
+
+def done_future(result=None, exception=None):
+    future = Future()
+    if exception is not None:
+        future.set_exception(exception)
+    else:
+        future.set_result(result)
+    return future
+
+
+def read_json(path):
+    with open(str(path), encoding='utf-8') as f:
+        return json.load(f)
+
+
+def test_run_job_ok(tasks):
+    result = run_job({'id': 'a', 'task': 'ok'})
+    assert result['id'] == 'a'
+    assert result['status'] == 'ok'
+    assert result['error'] is None
+    assert result['time'] >= 0
+
+
+def test_run_job_unknown_task(tasks):
+    result = run_job({'id': 'a', 'task': 'nope'})
+    assert result['status'] == 'error'
+    assert 'Unknown task: nope' in result['error']
+
+
+def test_run_job_exception(tasks):
+    result = run_job({'id': 'a', 'task': 'fail'})
+    assert result['status'] == 'error'
+    assert result['error'] == 'RuntimeError: boom'
+
+
+def test_parse_job():
+    assert parse_job('{"task": "ok"}') == {'task': 'ok'}
+    assert parse_job(b'{"task": "ok"}') == {'task': 'ok'}
+
+
+@pytest.mark.parametrize('data', ['[1, 2]', '1', '"job"', 'null', 'not json'])
+def test_parse_job_rejects(data):
+    with pytest.raises(ValueError):
+        parse_job(data)
+
+
+def test_write_result(tmp_path):
+    work_path = tmp_path / 'a.json.work'
+    work_path.write_text('{}')
+
+    WorkerService.write_result(str(work_path), {'id': 'a', 'status': 'ok'})
+
+    assert job_result_path(str(work_path)) == str(tmp_path / 'a.result.json')
+    assert read_json(tmp_path / 'a.result.json') == {'id': 'a', 'status': 'ok'}
+    assert not work_path.exists()
+
+
+def test_job_result_ok():
+    result = WorkerService.job_result({'id': 'a'}, done_future({'id': 'a', 'status': 'ok'}), 0)
+    assert result['status'] == 'ok'
+    assert 'total_time' in result
+
+
+def test_job_result_broken_pool():
+    future = done_future(exception=BrokenProcessPool('terminated abruptly'))
+    result = WorkerService.job_result({'id': 'a'}, future, 0)
+    assert result['id'] == 'a'
+    assert result['status'] == 'error'
+    assert result['error'].startswith('Worker process died')
+
+
+def test_claim_job(tasks, service, monkeypatch, tmp_path):
+    monkeypatch.setattr(service, 'submit_async', lambda job: done_future(run_job(job)))
+    (tmp_path / 'a.json').write_text('{"task": "ok"}')
+
+    service.claim_job(str(tmp_path / 'a.json'))
+
+    result = read_json(tmp_path / 'a.result.json')
+    assert result['id'] == 'a'
+    assert result['status'] == 'ok'
+    assert sorted(path.name for path in tmp_path.iterdir()) == ['a.result.json']
+
+
+@pytest.mark.parametrize('content', ['[1, 2]', 'not json'])
+def test_claim_job_bad(service, tmp_path, content):
+    (tmp_path / 'b.json').write_text(content)
+
+    service.claim_job(str(tmp_path / 'b.json'))
+
+    result = read_json(tmp_path / 'b.result.json')
+    assert result['id'] == 'b'
+    assert result['error'].startswith('Bad job')
+    assert sorted(path.name for path in tmp_path.iterdir()) == ['b.result.json']
+
+
+def test_recover_spool(service, tmp_path):
+    (tmp_path / 'c.json.work').write_text('{"task": "ok"}')
+    (tmp_path / 'd.json').write_text('{"task": "ok"}')
+
+    service.recover_spool(str(tmp_path))
+
+    result = read_json(tmp_path / 'c.result.json')
+    assert result['id'] == 'c'
+    assert result['error'].startswith('Interrupted')
+    assert sorted(path.name for path in tmp_path.iterdir()) == ['c.result.json', 'd.json']
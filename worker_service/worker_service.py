@@ -0,0 +1,353 @@
+import argparse
+import json
+import multiprocessing
+import os
+import socketserver
+import sys
+import threading
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'sxf2shp'))
+sys.path.insert(0, os.path.join(ROOT, 'shp_mesh_builder'))
+
+
+def init_worker():
+    """
+    Warm up worker process: import GDAL and utilities, register drivers, initialize PROJ database.
+    Executed once per worker, so jobs pay only for the conversion itself.
+    """
+    global gdal, ogr, osr, SxfExporter, GridBuilder
+
+    from osgeo import gdal, ogr, osr
+    from sxf2shp import SxfExporter
+    from clip_shapes_by_grid import GridBuilder
+
+    gdal.AllRegister()
+    ogr.RegisterAll()
+
+    source_crs = osr.SpatialReference()
+    source_crs.ImportFromEPSG(4284)
+    target_crs = osr.SpatialReference()
+    target_crs.ImportFromProj4("+proj=longlat +datum=WGS84 +no_defs")
+    osr.CoordinateTransformation(source_crs, target_crs)
+
+
+def sxf2shp_job(job):
+    """
+    Export SXF to SHP.
+    :param job: {"sxf": path, "out": directory, optional "layers", "where", "bbox", "sheet"}: dict.
+    """
+    project = SxfExporter(sxf=job['sxf'],
+                          shp_dir=job['out'],
+                          layers=job.get('layers'),
+                          where=job.get('where'),
+                          bbox=job.get('bbox'),
+                          sheet=job.get('sheet'))
+    try:
+        project.convert()
+    finally:
+        # convert() pushes quiet error handler, remove it to keep handler stack of worker clean
+        gdal.PopErrorHandler()
+
+
+def clip_job(job):
+    """
+    Clip shapefile (or each shapefile of directory) by scale grid.
+    :param job: {"scale": int, "shp": path to shapefile or directory, "out": directory}: dict.
+    """
+    shp = job['shp']
+    if os.path.isdir(shp):
+        files = [os.path.join(shp, file) for file in os.listdir(shp) if os.path.splitext(file)[1] == '.shp']
+    else:
+        files = [shp]
+
+    for file in files:
+        try:
+            GridBuilder.get_shapes_by_grid(int(job['scale']), str(file), str(job['out']))
+        finally:
+            gdal.PopErrorHandler()
+
+
+TASKS = {'sxf2shp': sxf2shp_job,
+         'clip': clip_job}
+
+
+def run_job(job):
+    """
+    Execute job in worker process.
+    :param job: Job description with "task" key [sxf2shp, clip]: dict.
+    :return: Result with status, error and process time: dict.
+    """
+    cur_time = time.time()
+    result = {'id': job.get('id'), 'task': job.get('task'), 'status': 'ok', 'error': None}
+
+    try:
+        if job.get('task') not in TASKS:
+            raise ValueError('Error. Unknown task: {}'.format(job.get('task')))
+        TASKS[job['task']](job)
+    except Exception as e:
+        result['status'] = 'error'
+        result['error'] = '{}: {}'.format(type(e).__name__, e)
+        traceback.print_exc()
+
+    result['time'] = round(time.time() - cur_time, 3)
+    return result
+
+
+def parse_job(data):
+    """
+    Parse job received from client.
+    :param data: JSON text: str or bytes.
+    :return: Job: dict.
+    """
+    job = json.loads(data)
+    if not isinstance(job, dict):
+        raise ValueError('job must be JSON object, got {}'.format(type(job).__name__))
+    return job
+
+
+def job_result_path(work_path):
+    """
+    Path of result file for claimed job: "name.json.work" -> "name.result.json".
+    """
+    return work_path[:-len('.json.work')] + '.result.json'
+
+
+def error_result(job_id, error):
+    return {'id': job_id, 'status': 'error', 'error': error}
+
+
+class ReusableTCPServer(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+
+class WorkerService:
+    """
+    Pool of warm worker processes accepting jobs over local socket and/or spool directory.
+    """
+
+    def __init__(self, processes=None, maxtasksperchild=None):
+        """
+        :param processes: Number of worker processes (number of CPUs by default): int.
+        :param maxtasksperchild: Restart worker after this number of jobs (never by default): int.
+        """
+        self.processes = processes
+        self.maxtasksperchild = maxtasksperchild
+        self.lock = threading.Lock()
+        self.executor = self.new_executor()
+
+    def new_executor(self):
+        # spawn: воркеры не наследуют потоки сервера, и только так работает max_tasks_per_child
+        options = {'max_workers': self.processes,
+                   'mp_context': multiprocessing.get_context('spawn'),
+                   'initializer': init_worker}
+        if self.maxtasksperchild is not None:
+            options['max_tasks_per_child'] = self.maxtasksperchild
+        return ProcessPoolExecutor(**options)
+
+    def submit_async(self, job):
+        """
+        Put job to pool. Broken pool (worker crashed or failed to start) is replaced with new one.
+        :param job: dict.
+        :return: concurrent.futures.Future.
+        """
+        with self.lock:
+            try:
+                return self.executor.submit(run_job, job)
+            except BrokenProcessPool:
+                self.executor.shutdown(wait=False, cancel_futures=True)
+                self.executor = self.new_executor()
+                return self.executor.submit(run_job, job)
+
+    @staticmethod
+    def job_result(job, future, start_time):
+        """
+        Result of finished job, worker crash is reported as error.
+        :return: Result of run_job with total time including waiting in queue: dict.
+        """
+        try:
+            result = future.result()
+        except BrokenProcessPool as e:
+            result = error_result(job.get('id'), 'Worker process died: {}'.format(e))
+        except Exception as e:
+            result = error_result(job.get('id'), '{}: {}'.format(type(e).__name__, e))
+        result['total_time'] = round(time.time() - start_time, 3)
+        return result
+
+    def submit(self, job):
+        """
+        Run job in pool and wait for result.
+        :param job: dict.
+        :return: Result of run_job with total time including waiting in queue: dict.
+        """
+        cur_time = time.time()
+        try:
+            future = self.submit_async(job)
+        except Exception as e:
+            return error_result(job.get('id'), 'Pool failed: {}'.format(e))
+        return self.job_result(job, future, cur_time)
+
+    def serve_socket(self, host, port):
+        """
+        Accept jobs over TCP: one JSON job per line, one JSON result per line in response.
+        :param host: Host to listen, keep it local: str.
+        :param port: int.
+        """
+        service = self
+
+        class JobHandler(socketserver.StreamRequestHandler):
+            def handle(self):
+                for line in self.rfile:
+                    if not line.strip():
+                        continue
+                    try:
+                        job = parse_job(line.decode('utf-8'))
+                    except ValueError as e:
+                        result = error_result(None, 'Bad job: {}'.format(e))
+                    else:
+                        result = service.submit(job)
+                    self.wfile.write((json.dumps(result, ensure_ascii=False) + '\n').encode('utf-8'))
+                    self.wfile.flush()
+
+        server = ReusableTCPServer((host, port), JobHandler)
+        print('listening on {}:{}'.format(host, port))
+        server.serve_forever()
+
+    def serve_spool(self, spool_dir, interval=0.05):
+        """
+        Watch spool directory for job files "*.json" and write results to "*.result.json" next to them.
+        Result is written as soon as job finishes, poll interval affects only discovery of new jobs.
+        :param spool_dir: Directory with job files: str.
+        :param interval: Poll interval in seconds: float.
+        """
+        if not os.path.isdir(spool_dir):
+            raise ValueError("Error. Spool directory doesn't exist")
+
+        self.recover_spool(spool_dir)
+        print('watching', spool_dir)
+
+        while True:
+            for file in sorted(os.listdir(spool_dir)):
+                if not file.endswith('.json') or file.endswith('.result.json'):
+                    continue
+
+                # Никакое задание не должно остановить наблюдение за каталогом
+                try:
+                    self.claim_job(os.path.join(spool_dir, file))
+                except Exception:
+                    traceback.print_exc()
+
+            time.sleep(interval)
+
+    def claim_job(self, job_path):
+        """
+        Claim job file and put it to pool, result is written by callback of future.
+        :param job_path: Path to "*.json" job file: str.
+        """
+        # Переименование захватывает задание, чтобы оно не было запущено повторно
+        work_path = job_path + '.work'
+        try:
+            os.rename(job_path, work_path)
+        except OSError:
+            return
+
+        job_id = os.path.splitext(os.path.basename(job_path))[0]
+        try:
+            with open(work_path, encoding='utf-8') as f:
+                job = parse_job(f.read())
+        except (OSError, ValueError) as e:
+            self.write_result(work_path, error_result(job_id, 'Bad job: {}'.format(e)))
+            return
+
+        job.setdefault('id', job_id)
+        start_time = time.time()
+
+        def done(future):
+            try:
+                self.write_result(work_path, self.job_result(job, future, start_time))
+            except Exception:
+                traceback.print_exc()
+
+        try:
+            self.submit_async(job).add_done_callback(done)
+        except Exception as e:
+            self.write_result(work_path, error_result(job['id'], 'Pool failed: {}'.format(e)))
+
+    def recover_spool(self, spool_dir):
+        """
+        Write error results for jobs claimed by previous run of service which was stopped before they finished.
+        :param spool_dir: Directory with job files: str.
+        """
+        for file in sorted(os.listdir(spool_dir)):
+            if file.endswith('.json.work'):
+                job_id = file[:-len('.json.work')]
+                self.write_result(os.path.join(spool_dir, file),
+                                  error_result(job_id, 'Interrupted: service stopped before job finished'))
+
+    @staticmethod
+    def write_result(work_path, result):
+        with open(job_result_path(work_path), 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+        if os.path.exists(work_path):
+            os.remove(work_path)
+        print(result)
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+
+
+def main():
+    """
+    Main function for command line utility. At least one of -port, -spool is required.
+    :return: result.
+    """
+
+    def arguments():
+        parser = argparse.ArgumentParser(description='Service with warm workers for sxf2shp and clip_shapes_by_grid jobs')
+        parser.add_argument('-port',
+                            type=int,
+                            help='Port to accept jobs over local socket')
+        parser.add_argument('-host',
+                            default='127.0.0.1',
+                            help='Host to listen (127.0.0.1 by default)')
+        parser.add_argument('-spool',
+                            help='Directory to watch for job files')
+        parser.add_argument('-workers',
+                            type=int,
+                            help='Number of worker processes (number of CPUs by default)')
+        parser.add_argument('-maxtasks',
+                            type=int,
+                            help='Restart worker after this number of jobs')
+        p = parser.parse_args()
+
+        if p.port is None and p.spool is None:
+            parser.error('one of -port, -spool is required')
+        if p.spool is not None and not os.path.isdir(p.spool):
+            parser.error("spool directory doesn't exist: {}".format(p.spool))
+
+        return [p.port, p.host, p.spool, p.workers, p.maxtasks]
+
+    port, host, spool, workers, maxtasks = arguments()
+    service = WorkerService(processes=workers, maxtasksperchild=maxtasks)
+
+    try:
+        if port is not None and spool is not None:
+            threading.Thread(target=service.serve_spool, args=(spool,), daemon=True).start()
+            service.serve_socket(host, port)
+        elif port is not None:
+            service.serve_socket(host, port)
+        else:
+            service.serve_spool(spool)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.close()
+
+
+if __name__ == '__main__':
+    main()